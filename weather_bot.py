@@ -1,27 +1,60 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from quart import Quart, request, jsonify
+from quart.json.provider import DefaultJSONProvider
+from quart_cors import cors
+import orjson
 import google.generativeai as genai
+import io
+import logging
+import math
 import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.agents import initialize_agent, Tool
-from langchain.memory import ConversationBufferMemory
-import requests
+from langchain.memory import ConversationBufferWindowMemory
+import aiohttp
 from supabase import create_client, Client
 import asyncio
-from functools import partial
+from collections import defaultdict
+from functools import lru_cache, partial
+import cachetools
+import redis.asyncio as redis
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app)
-
-# Initialize Supabase client
-supabase_url = os.getenv('SUPABASE_URL')
-supabase_key = os.getenv('SUPABASE_KEY')
-supabase: Client = create_client(supabase_url, supabase_key)
+# Log through a queue so the request path only enqueues; the listener's
+# thread does the actual (blocking) write to stderr
+_log_queue = queue.Queue(-1)
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+logger = logging.getLogger(__name__)
+logger.addHandler(QueueHandler(_log_queue))
+logger.setLevel(logging.INFO)
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, which serializes straight to bytes."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+# Initialize Quart app (ASGI, so handlers can await directly)
+app = Quart(__name__)
+app.json = OrjsonProvider(app)
+app = cors(app)
+
+# Supabase client accessor; lru_cache guarantees a single client (and its
+# pooled HTTP connections) even across hot reloads or repeat imports
+@lru_cache(maxsize=1)
+def get_supabase() -> Client:
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_KEY')
+    return create_client(supabase_url, supabase_key)
 
 # Retrieve the API key from the .env file
 google_api_key = os.getenv('GOOGLE_API_KEY')
@@ -33,187 +66,408 @@ genai.configure(api_key=google_api_key)
 WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
 WEATHER_API_URL = "http://api.openweathermap.org/data/2.5/weather"
 
-async def get_user_profile(user_id):
+# OpenWeatherMap only refreshes roughly every 10 minutes, so cache per city.
+# Errors get their own short-lived cache so a flaky upstream isn't hammered.
+WEATHER_CACHE = cachetools.TTLCache(maxsize=1024, ttl=600)
+WEATHER_ERROR_CACHE = cachetools.TTLCache(maxsize=1024, ttl=30)
+# city key -> Future for the fetch currently in flight; concurrent misses
+# await the first caller's future instead of fetching themselves
+WEATHER_INFLIGHT = {}
+
+# Profiles change rarely; a short TTL keeps repeat messages from the same
+# user off Supabase while staying fresh enough for profile edits.
+PROFILE_CACHE = cachetools.TTLCache(maxsize=10_000, ttl=120)
+PROFILE_LOCKS = defaultdict(asyncio.Lock)
+
+# Optional shared cache layer so multiple hypercorn workers don't each
+# refetch the same city/profile. Enabled by setting REDIS_URL; without it
+# the in-process caches above still apply.
+REDIS_URL = os.getenv('REDIS_URL')
+REDIS = redis.Redis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
+
+async def _redis_get(key):
+    if REDIS is None:
+        return None
     try:
-        # Get user profile from database
-        result = await supabase.from_('profiles').select('*').eq('id', user_id).single()
-        return result.data if result else None
-    except Exception as e:
-        print(f"Error fetching user profile: {e}")
+        cached = await REDIS.get(key)
+    except Exception:
+        logger.exception("Redis error")
         return None
+    return orjson.loads(cached) if cached is not None else None
 
-def get_health_recommendations(weather_data, user_profile):
-    recommendations = []
-    temp = weather_data["temp"]
-    humidity = weather_data["humidity"]
-    conditions = weather_data["description"].lower()
+async def _redis_setex(key, ttl, value):
+    if REDIS is None:
+        return
+    try:
+        await REDIS.setex(key, ttl, orjson.dumps(value))
+    except Exception:
+        logger.exception("Redis error")
 
-    if user_profile:
-        # Health conditions
-        for condition in user_profile.get('health_conditions', []):
-            condition = condition.lower()
-            if condition == 'asthma':
-                if humidity > 70:
-                    recommendations.append("⚠️ High humidity may affect your asthma. Consider staying indoors.")
-                if 'rain' in conditions or 'mist' in conditions:
-                    recommendations.append("🌧️ Damp conditions may trigger asthma. Keep inhaler handy.")
-            elif condition == 'heart condition':
-                if temp > 30:
-                    recommendations.append("❤️ High temperature may strain your heart. Stay in air-conditioned spaces.")
-                elif temp < 5:
-                    recommendations.append("❄️ Cold weather can affect blood pressure. Stay warm and avoid overexertion.")
-            elif condition == 'diabetes':
-                if temp > 30:
-                    recommendations.append("📊 Heat can affect blood sugar levels. Check levels more frequently.")
-                if humidity > 80:
-                    recommendations.append("💧 High humidity can affect insulin absorption. Monitor closely.")
-
-        # Weather sensitivities
-        for sensitivity in user_profile.get('weather_sensitivities', []):
-            sensitivity = sensitivity.lower()
-            if sensitivity == 'cold' and temp < 10:
-                recommendations.append("🌡️ Temperature is low and you're sensitive to cold. Bundle up well.")
-            elif sensitivity == 'heat' and temp > 28:
-                recommendations.append("🌞 Temperature is high and you're heat-sensitive. Stay hydrated and in shade.")
-            elif sensitivity == 'humidity' and humidity > 70:
-                recommendations.append("💧 High humidity detected. Use dehumidifier indoors if possible.")
-            elif sensitivity == 'air quality' and weather_data.get("air_quality", 0) > 100:
-                recommendations.append("😷 Poor air quality. Consider wearing a mask outdoors.")
-
-        # Allergies
-        for allergy in user_profile.get('allergies', []):
-            allergy = allergy.lower()
-            if allergy == 'pollen':
-                if 'clear' in conditions or 'sunny' in conditions:
-                    recommendations.append("🌼 High pollen risk today. Take antihistamines if needed.")
-            elif allergy == 'dust':
-                if 'windy' in conditions:
-                    recommendations.append("💨 Windy conditions may stir up dust. Wear a mask if needed.")
+async def _redis_delete(key):
+    if REDIS is None:
+        return
+    try:
+        await REDIS.delete(key)
+    except Exception:
+        logger.exception("Redis error")
+
+# Shared aiohttp session so repeat weather calls reuse pooled connections.
+# Created lazily so it binds to whichever event loop is running.
+SESSION = None
+
+async def _get_session():
+    global SESSION
+    if SESSION is None or SESSION.closed:
+        SESSION = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=5),
+            connector=aiohttp.TCPConnector(
+                limit=100,
+                limit_per_host=20,
+                ttl_dns_cache=600,
+                keepalive_timeout=60
+            )
+        )
+    return SESSION
+
+async def _close_session():
+    global SESSION
+    if SESSION is not None and not SESSION.closed:
+        await SESSION.close()
+    SESSION = None
+
+async def _noop():
+    return None
+
+# The serving loop, captured at startup so worker threads can schedule
+# coroutines back onto it
+MAIN_LOOP = None
+
+@app.before_serving
+async def _startup():
+    global MAIN_LOOP
+    MAIN_LOOP = asyncio.get_running_loop()
+    await _get_session()
+
+@app.after_serving
+async def _shutdown():
+    await _close_session()
+
+def _normalize_profile(profile):
+    # Lowercase the tag lists once, at cache-insert time, so the per-request
+    # recommendation code can use plain set operations.
+    if not profile:
+        return profile
+    profile = dict(profile)
+    for field in ('health_conditions', 'weather_sensitivities', 'allergies'):
+        profile[field] = frozenset(tag.lower() for tag in profile.get(field) or ())
+    return profile
+
+async def get_user_profile(user_id):
+    if user_id in PROFILE_CACHE:
+        return PROFILE_CACHE[user_id]
+
+    # Per-user lock so concurrent misses share one Supabase round-trip
+    async with PROFILE_LOCKS[user_id]:
+        if user_id in PROFILE_CACHE:
+            return PROFILE_CACHE[user_id]
+
+        # Shared cache stores the raw profile (frozensets don't serialize)
+        raw = await _redis_get(f"profile:{user_id}")
+        if raw is None:
+            try:
+                # Get user profile from database
+                result = await get_supabase().from_('profiles').select('*').eq('id', user_id).single()
+                raw = result.data if result else None
+            except Exception:
+                logger.exception("Error fetching user profile")
+                return None
+            if raw is not None:
+                await _redis_setex(f"profile:{user_id}", 120, raw)
+        profile = _normalize_profile(raw)
+        PROFILE_CACHE[user_id] = profile
+        return profile
+
+# Health rules as static (predicate, message) tables built once at import.
+# Each predicate gets the weather dict and the description token set; adding
+# a condition is just another table entry.
+HEALTH_RULES = (
+    ('health_conditions', {
+        'asthma': (
+            (lambda w, t: w["humidity"] > 70,
+             "⚠️ High humidity may affect your asthma. Consider staying indoors."),
+            (lambda w, t: 'rain' in t or 'mist' in t,
+             "🌧️ Damp conditions may trigger asthma. Keep inhaler handy."),
+        ),
+        'heart condition': (
+            (lambda w, t: w["temp"] > 30,
+             "❤️ High temperature may strain your heart. Stay in air-conditioned spaces."),
+            (lambda w, t: w["temp"] < 5,
+             "❄️ Cold weather can affect blood pressure. Stay warm and avoid overexertion."),
+        ),
+        'diabetes': (
+            (lambda w, t: w["temp"] > 30,
+             "📊 Heat can affect blood sugar levels. Check levels more frequently."),
+            (lambda w, t: w["humidity"] > 80,
+             "💧 High humidity can affect insulin absorption. Monitor closely."),
+        ),
+    }),
+    ('weather_sensitivities', {
+        'cold': (
+            (lambda w, t: w["temp"] < 10,
+             "🌡️ Temperature is low and you're sensitive to cold. Bundle up well."),
+        ),
+        'heat': (
+            (lambda w, t: w["temp"] > 28,
+             "🌞 Temperature is high and you're heat-sensitive. Stay hydrated and in shade."),
+        ),
+        'humidity': (
+            (lambda w, t: w["humidity"] > 70,
+             "💧 High humidity detected. Use dehumidifier indoors if possible."),
+        ),
+        'air quality': (
+            (lambda w, t: w.get("air_quality", 0) > 100,
+             "😷 Poor air quality. Consider wearing a mask outdoors."),
+        ),
+    }),
+    ('allergies', {
+        'pollen': (
+            (lambda w, t: 'clear' in t or 'sunny' in t,
+             "🌼 High pollen risk today. Take antihistamines if needed."),
+        ),
+        'dust': (
+            (lambda w, t: 'windy' in t,
+             "💨 Windy conditions may stir up dust. Wear a mask if needed."),
+        ),
+    }),
+)
+
+def get_health_recommendations(weather_data, user_profile, cond_tokens=None):
+    recommendations = []
+    if not user_profile:
+        return recommendations
+
+    if cond_tokens is None:
+        cond_tokens = set(weather_data["description"].lower().split())
+
+    for field, rules in HEALTH_RULES:
+        tags = user_profile.get(field) or ()
+        if not isinstance(tags, frozenset):
+            # Profile didn't come through the cache; normalize on the fly
+            tags = frozenset(tag.lower() for tag in tags)
+        # Iterate the table, not the tag set, so advice comes out in the
+        # authored order instead of hash order
+        for tag, tag_rules in rules.items():
+            if tag not in tags:
+                continue
+            for predicate, message in tag_rules:
+                if predicate(weather_data, cond_tokens):
+                    recommendations.append(message)
 
     return recommendations
 
+# Static advice per temperature band, built once at import so the per-request
+# path only extends from existing tuples instead of re-allocating literals.
+# Activities are tagged (text, is_outdoor) at authoring time; the full and
+# indoor-only tuples are derived once at import, so the poor-air-quality
+# filter is a constant swap instead of substring scans per request.
+_HOT_ACTIVITIES_TAGGED = (
+    ("❌ Avoid strenuous outdoor activities", True),
+    ("✅ Indoor swimming", False),
+    ("✅ Indoor gym workouts", False),
+    ("✅ Mall walking", False),
+    ("✅ Indoor sports", False)
+)
+_HOT_FOOD = (
+    "🥤 Drink plenty of water (at least 3-4 liters)",
+    "🥗 Light meals with high water content",
+    "🍎 Fresh fruits and vegetables",
+    "🧂 Electrolyte-rich drinks",
+    "❌ Avoid heavy, spicy foods"
+)
+_HOT_GENERAL = (
+    "⏰ Plan activities early morning or late evening",
+    "👕 Wear light, breathable clothing",
+    "🧴 Use sunscreen (SPF 50+)",
+    "🕶 Wear sunglasses and a hat"
+)
+_WARM_ACTIVITIES_TAGGED = (
+    ("✅ Swimming", False),
+    ("✅ Early morning/late evening walks", False),
+    ("✅ Beach activities (with proper protection)", True),
+    ("⚠️ Moderate outdoor activities", True)
+)
+_WARM_FOOD = (
+    "🥤 Stay well hydrated",
+    "🥗 Fresh salads",
+    "🍊 Seasonal fruits",
+    "🥤 Sports drinks for outdoor activities"
+)
+_MILD_ACTIVITIES_TAGGED = (
+    ("✅ Most outdoor activities are comfortable", True),
+    ("✅ Walking, jogging, cycling", False),
+    ("✅ Outdoor sports", True),
+    ("✅ Sightseeing", False)
+)
+
+def _split_tagged(tagged):
+    return (tuple(text for text, _ in tagged),
+            tuple(text for text, outdoor in tagged if not outdoor))
+
+_HOT_ACTIVITIES, _HOT_ACTIVITIES_INDOOR = _split_tagged(_HOT_ACTIVITIES_TAGGED)
+_WARM_ACTIVITIES, _WARM_ACTIVITIES_INDOOR = _split_tagged(_WARM_ACTIVITIES_TAGGED)
+_MILD_ACTIVITIES, _MILD_ACTIVITIES_INDOOR = _split_tagged(_MILD_ACTIVITIES_TAGGED)
+_MILD_FOOD = (
+    "🥤 Regular water intake",
+    "🍽️ Regular balanced meals",
+    "🥪 Pack snacks for outdoor activities"
+)
+
+# (matches, activities, indoor activities, food, general) — first matching
+# bucket wins
+TEMP_BUCKETS = (
+    (lambda temp: temp > 35, _HOT_ACTIVITIES, _HOT_ACTIVITIES_INDOOR, _HOT_FOOD, _HOT_GENERAL),
+    (lambda temp: temp >= 25, _WARM_ACTIVITIES, _WARM_ACTIVITIES_INDOOR, _WARM_FOOD, ()),
+    (lambda temp: True, _MILD_ACTIVITIES, _MILD_ACTIVITIES_INDOOR, _MILD_FOOD, ()),
+)
+
+# General advice per weather-description token; first match wins
+CONDITION_ADVICE = {
+    'rain': (
+        "☔ Carry an umbrella",
+        "🧥 Wear waterproof clothing",
+        "👟 Wear appropriate footwear"
+    ),
+    'clear': (
+        "🕶 Wear sunglasses",
+        "🧴 Apply sunscreen",
+        "👒 Wear a hat for sun protection"
+    ),
+}
+
+_AIR_QUALITY_ADVICE = "😷 Consider wearing a mask due to poor air quality"
+
 def get_comprehensive_recommendations(weather_data, user_profile=None):
     temp = weather_data["temp"]
-    humidity = weather_data["humidity"]
     conditions = weather_data["description"].lower()
-    
-    # Initialize recommendation categories
+    cond_tokens = set(conditions.split())
+
+    # Seed the recommendation categories straight from the matching
+    # temperature bucket's constant tuples
+    _, activities, indoor_activities, food, general = next(
+        bucket for bucket in TEMP_BUCKETS if bucket[0](temp)
+    )
     recommendations = {
         "health_advice": [],
-        "activities": [],
-        "food_suggestions": [],
-        "general_advice": []
+        "activities": list(activities),
+        "food_suggestions": list(food),
+        "general_advice": list(general)
     }
-    
-    # Activity recommendations based on weather
-    if temp > 35:
-        recommendations["activities"].extend([
-            "❌ Avoid strenuous outdoor activities",
-            "✅ Indoor swimming",
-            "✅ Indoor gym workouts",
-            "✅ Mall walking",
-            "✅ Indoor sports"
-        ])
-        recommendations["food_suggestions"].extend([
-            "🥤 Drink plenty of water (at least 3-4 liters)",
-            "🥗 Light meals with high water content",
-            "🍎 Fresh fruits and vegetables",
-            "🧂 Electrolyte-rich drinks",
-            "❌ Avoid heavy, spicy foods"
-        ])
-        recommendations["general_advice"].extend([
-            "⏰ Plan activities early morning or late evening",
-            "👕 Wear light, breathable clothing",
-            "🧴 Use sunscreen (SPF 50+)",
-            "🕶 Wear sunglasses and a hat"
-        ])
-    elif 25 <= temp <= 35:
-        recommendations["activities"].extend([
-            "✅ Swimming",
-            "✅ Early morning/late evening walks",
-            "✅ Beach activities (with proper protection)",
-            "⚠️ Moderate outdoor activities"
-        ])
-        recommendations["food_suggestions"].extend([
-            "🥤 Stay well hydrated",
-            "🥗 Fresh salads",
-            "🍊 Seasonal fruits",
-            "🥤 Sports drinks for outdoor activities"
-        ])
-    else:
-        recommendations["activities"].extend([
-            "✅ Most outdoor activities are comfortable",
-            "✅ Walking, jogging, cycling",
-            "✅ Outdoor sports",
-            "✅ Sightseeing"
-        ])
-        recommendations["food_suggestions"].extend([
-            "🥤 Regular water intake",
-            "🍽️ Regular balanced meals",
-            "🥪 Pack snacks for outdoor activities"
-        ])
 
     # Add health-specific recommendations if user profile exists
     if user_profile:
-        health_recs = get_health_recommendations(weather_data, user_profile)
+        health_recs = get_health_recommendations(weather_data, user_profile, cond_tokens)
         recommendations["health_advice"].extend(health_recs)
 
     # Weather condition specific advice
-    if 'rain' in conditions:
-        recommendations["general_advice"].extend([
-            "☔ Carry an umbrella",
-            "🧥 Wear waterproof clothing",
-            "👟 Wear appropriate footwear"
-        ])
-    elif 'clear' in conditions:
-        recommendations["general_advice"].extend([
-            "🕶 Wear sunglasses",
-            "🧴 Apply sunscreen",
-            "👒 Wear a hat for sun protection"
-        ])
+    for token, advice in CONDITION_ADVICE.items():
+        if token in cond_tokens:
+            recommendations["general_advice"].extend(advice)
+            break
 
     # Air quality based recommendations
     if weather_data.get("air_quality", 0) > 100:
-        recommendations["health_advice"].append("😷 Consider wearing a mask due to poor air quality")
-        recommendations["activities"] = [act for act in recommendations["activities"] 
-                                      if not any(outdoor in act.lower() for outdoor in ['outdoor', 'outside', 'beach'])]
+        recommendations["health_advice"].append(_AIR_QUALITY_ADVICE)
+        recommendations["activities"] = list(indoor_activities)
 
     return recommendations
 
-def format_recommendations(recommendations):
-    sections = []
-    
-    if recommendations["health_advice"]:
-        sections.append("🏥 Health Recommendations:")
-        sections.extend(recommendations["health_advice"])
-        sections.append("")
-    
-    if recommendations["activities"]:
-        sections.append("🏃 Activity Recommendations:")
-        sections.extend(recommendations["activities"])
-        sections.append("")
-    
-    if recommendations["food_suggestions"]:
-        sections.append("🍽️ Food & Hydration Advice:")
-        sections.extend(recommendations["food_suggestions"])
-        sections.append("")
-    
-    if recommendations["general_advice"]:
-        sections.append("💡 General Advice:")
-        sections.extend(recommendations["general_advice"])
-    
-    return "\n".join(sections)
+_SECTION_HEADERS = (
+    ("🏥 Health Recommendations:", "health_advice"),
+    ("🏃 Activity Recommendations:", "activities"),
+    ("🍽️ Food & Hydration Advice:", "food_suggestions"),
+    ("💡 General Advice:", "general_advice"),
+)
 
-def get_weather_data(city):
+def format_recommendations(recommendations):
+    if not any(recommendations.values()):
+        return ""
+
+    # Write straight into one buffer instead of building an intermediate
+    # list of lines and joining at the end
+    buf = io.StringIO()
+    write = buf.write
+    first = True
+    for header, key in _SECTION_HEADERS:
+        items = recommendations[key]
+        if not items:
+            continue
+        if not first:
+            write("\n\n")
+        write(header)
+        write("\n")
+        write("\n".join(items))
+        first = False
+
+    return buf.getvalue()
+
+def _normalize_city(city):
+    # "London", "london ", "New  York" and "London, UK"/"London,UK" each
+    # collapse to one cache key; the country part is kept so distinct
+    # cities that share a name don't collide
+    return ",".join(" ".join(part.split()) for part in city.casefold().split(","))
+
+def _cached_weather(key):
+    cached = WEATHER_CACHE.get(key)
+    if cached is None:
+        cached = WEATHER_ERROR_CACHE.get(key)
+    return cached
+
+async def get_weather_data(city):
+    key = _normalize_city(city)
+    cached = _cached_weather(key)
+    if cached is not None:
+        return cached
+
+    # Singleflight: if a fetch for this city is already in flight, wait for
+    # its result rather than issuing another upstream call
+    inflight = WEATHER_INFLIGHT.get(key)
+    if inflight is not None:
+        return await inflight
+
+    future = asyncio.get_running_loop().create_future()
+    WEATHER_INFLIGHT[key] = future
+    try:
+        # Another worker may already have this city in the shared cache
+        weather = await _redis_get(f"wx:{key}")
+        if weather is None:
+            weather = await _fetch_weather_data(city)
+            if "error" in weather:
+                WEATHER_ERROR_CACHE[key] = weather
+            else:
+                WEATHER_CACHE[key] = weather
+                await _redis_setex(f"wx:{key}", 600, weather)
+        else:
+            WEATHER_CACHE[key] = weather
+        future.set_result(weather)
+        return weather
+    except BaseException as e:
+        # _fetch_weather_data shouldn't raise, but waiters must be woken
+        future.set_exception(e)
+        raise
+    finally:
+        WEATHER_INFLIGHT.pop(key, None)
+
+async def _fetch_weather_data(city):
     try:
         params = {
             'q': city,
             'appid': WEATHER_API_KEY,
             'units': 'metric'
         }
-        response = requests.get(WEATHER_API_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
+        session = await _get_session()
+        async with session.get(WEATHER_API_URL, params=params) as response:
+            response.raise_for_status()
+            data = await response.json()
 
         weather = {
             "temp": data["main"]["temp"],
@@ -223,18 +477,31 @@ def get_weather_data(city):
         }
         return weather
 
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error occurred: {http_err}")
+    except aiohttp.ClientResponseError:
+        logger.exception("HTTP error occurred")
         return {"error": "Failed to fetch weather data."}
-    except Exception as err:
-        print(f"Other error occurred: {err}")
+    except Exception:
+        logger.exception("Other error occurred")
         return {"error": "Failed to fetch weather data."}
 
 async def get_weather_with_health_context(city, user_id=None):
-    weather_data = get_weather_data(city)
+    # Fetch weather and profile concurrently instead of one after the other.
+    # return_exceptions keeps a Supabase outage from taking the weather
+    # answer down with it — we just degrade to no personalization.
+    weather_data, user_profile = await asyncio.gather(
+        get_weather_data(city),
+        get_user_profile(user_id) if user_id else _noop(),
+        return_exceptions=True
+    )
+    if isinstance(weather_data, Exception):
+        logger.error("Weather fetch failed: %s", weather_data)
+        weather_data = {"error": "Failed to fetch weather data."}
+    if isinstance(user_profile, Exception):
+        logger.error("Profile fetch failed: %s", user_profile)
+        user_profile = None
     if "error" in weather_data:
         return str(weather_data)
-    
+
     response_parts = [
         f"🌡️ Current weather in {city}:",
         f"Temperature: {weather_data['temp']}°C",
@@ -243,33 +510,90 @@ async def get_weather_with_health_context(city, user_id=None):
         f"Wind Speed: {weather_data['wind_speed']} m/s",
         ""  # Empty line for spacing
     ]
-    
-    user_profile = None
-    if user_id:
-        user_profile = await get_user_profile(user_id)
-    
+
     recommendations = get_comprehensive_recommendations(weather_data, user_profile)
     formatted_recommendations = format_recommendations(recommendations)
     response_parts.append(formatted_recommendations)
     
     return "\n".join(response_parts)
 
-def sync_weather_tool(input_str: str, **kwargs):
-    user_id = kwargs.get('user_id')
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    result = loop.run_until_complete(get_weather_with_health_context(input_str, user_id))
-    loop.close()
-    return result
+# Semantic LLM-response cache: near-duplicate messages ("weather in Paris"
+# vs "what's the weather in Paris") reuse a recent Gemini answer instead of
+# paying a full agent round-trip. Namespaced per user to avoid leaking
+# personalized answers across users.
+SEMANTIC_CACHE_TTL = 600
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_MAX_PER_USER = 64
+SEMANTIC_CACHE = defaultdict(list)  # user_id -> [[embedding, response, timestamp], ...]
+
+async def _embed_message(message):
+    try:
+        # genai.embed_content is blocking, so keep it off the event loop
+        result = await asyncio.to_thread(
+            genai.embed_content,
+            model="models/text-embedding-004",
+            content=message,
+            task_type="semantic_similarity"
+        )
+        return result["embedding"]
+    except Exception:
+        logger.exception("Embedding error")
+        return None
+
+def _cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+def _cached_agent_response(user_id, embedding):
+    entries = SEMANTIC_CACHE.get(user_id)
+    if not entries:
+        return None
+
+    now = time.monotonic()
+    entries[:] = [entry for entry in entries if now - entry[2] < SEMANTIC_CACHE_TTL]
+
+    best_response = None
+    best_similarity = SEMANTIC_CACHE_THRESHOLD
+    for cached_embedding, response, _ in entries:
+        similarity = _cosine_similarity(embedding, cached_embedding)
+        if similarity >= best_similarity:
+            best_response, best_similarity = response, similarity
+    return best_response
+
+def _store_agent_response(user_id, embedding, response):
+    entries = SEMANTIC_CACHE[user_id]
+    entries.append([embedding, response, time.monotonic()])
+    if len(entries) > SEMANTIC_CACHE_MAX_PER_USER:
+        del entries[0]
+
+@lru_cache(maxsize=1)
+def get_llm():
+    return ChatGoogleGenerativeAI(model="gemini-1.5-pro-latest")
+
+def sync_weather_tool(input_str, **kwargs):
+    # Sync entry point for when the agent runs on its non-async code path
+    # (in a worker thread via asyncio.to_thread). Hop back onto the serving
+    # loop so the shared session, locks and in-flight futures all stay on
+    # one loop; the worker thread just blocks on the result.
+    coro = get_weather_with_health_context(input_str, kwargs.get('user_id'))
+    if MAIN_LOOP is not None and MAIN_LOOP.is_running():
+        return asyncio.run_coroutine_threadsafe(coro, MAIN_LOOP).result()
+    return asyncio.run(coro)
 
 class WeatherAgent:
     def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(model="gemini-1.5-pro-latest")
-        self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        self.llm = get_llm()
+        # Window the history so the prompt stays a constant size instead of
+        # growing with every turn of the conversation
+        self.memory = ConversationBufferWindowMemory(
+            memory_key="chat_history", return_messages=True, k=6
+        )
         self.tools = [
             Tool(
                 name="WeatherFetcher",
                 func=sync_weather_tool,
+                coroutine=get_weather_with_health_context,
                 description="Useful to get the current weather of a given city along with health recommendations."
             )
         ]
@@ -282,21 +606,38 @@ class WeatherAgent:
             handle_parsing_errors=True
         )
 
-    def run(self, message, user_id=None):
+    async def arun(self, message, user_id=None):
+        embedding = await _embed_message(message)
+        if embedding is not None:
+            cached = _cached_agent_response(user_id, embedding)
+            if cached is not None:
+                return cached
+
         # Extract just the input message for the agent
         try:
-            return self.agent.run(message, callbacks=None)
+            try:
+                response = await self.agent.arun(message, callbacks=None)
+            except NotImplementedError:
+                # Some chain components have no async support; run the sync
+                # agent in a worker thread so the event loop stays free
+                response = await asyncio.to_thread(self.agent.run, message, callbacks=None)
         except Exception as e:
-            print(f"Agent error: {str(e)}")
+            logger.exception("Agent error")
             return f"I encountered an error: {str(e)}"
 
-# Initialize the agent
-agent = WeatherAgent()
+        if embedding is not None:
+            _store_agent_response(user_id, embedding, response)
+        return response
+
+# Agent accessor — a single WeatherAgent instance shared by all requests
+@lru_cache(maxsize=1)
+def get_agent():
+    return WeatherAgent()
 
 @app.route('/chat', methods=['POST'])
-def handle_chat_with_agent():
+async def handle_chat_with_agent():
     try:
-        data = request.get_json()
+        data = await request.get_json()
         message = data.get('message')
         user_id = data.get('user_id')
 
@@ -304,7 +645,7 @@ def handle_chat_with_agent():
             return jsonify({'error': 'Message is required'}), 400
 
         # Call the agent with just the message
-        response = agent.run(message, user_id)
+        response = await get_agent().arun(message, user_id)
 
         return jsonify({
             'response': response
@@ -316,6 +657,19 @@ def handle_chat_with_agent():
             'message': 'Failed to process your request'
         }), 500
 
+@app.route('/profile/invalidate', methods=['POST'])
+async def invalidate_profile():
+    data = await request.get_json()
+    user_id = data.get('user_id') if data else None
+
+    if not user_id:
+        return jsonify({'error': 'user_id is required'}), 400
+
+    # Drop the cached profile so the next request sees fresh data
+    PROFILE_CACHE.pop(user_id, None)
+    await _redis_delete(f"profile:{user_id}")
+    return jsonify({'status': 'ok'})
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 10000))  # default to 10000
     app.run(host='0.0.0.0', port=port)